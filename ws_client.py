@@ -1,7 +1,13 @@
-import socket,cv2, pickle,struct
+import os
+os.environ.setdefault("OMP_NUM_THREADS", "1") # must be set before cv2/numpy load their thread pools
+import socket,cv2, struct
+import numpy as np
+import queue
 import time
 import threading
 
+cv2.setNumThreads(1) # one small frame at a time: thread fan-out costs more than it saves
+
 #Firstly run ws_server
 
 sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -9,39 +15,93 @@ sock.connect(("8.8.8.8", 80))  # Google's public DNS server and port 80
 host_ip = sock.getsockname()[0] 
 port = 8002
 
-data = b""
-payload_size = struct.calcsize("Q")
+# Wire format: [uint64 size][JPEG bytes]
+HEADER = struct.Struct("Q")
+unpack_header = HEADER.unpack_from
+MAX_FRAME_BYTES = 8*1024*1024 # a half-resolution Q80 JPEG is tens of KB; anything near this is a bad header
+
+payload_size = HEADER.size
 print("payload_size", payload_size)
 
 
+def recv_exact(conn, buf):
+    # Fill buf straight from the socket; False if the peer closed first
+    view = memoryview(buf)
+    offset = 0
+    while offset < len(buf):
+        n = conn.recv_into(view[offset:])
+        if not n:
+            return False
+        offset += n
+    return True
+
+
+def receive_frames(conn, frames):
+    # Network thread: keep the socket drained and hand only the newest frame to the GUI
+    header = bytearray(payload_size)
+    while True:
+        if not recv_exact(conn, header):
+            break
+        msg_size = unpack_header(header)[0]
+        if not msg_size or msg_size > MAX_FRAME_BYTES:
+            print("ERROR: bad frame size %d, disconnecting" % msg_size)
+            break
+
+        frame_data = bytearray(msg_size)
+        if not recv_exact(conn, frame_data):
+            break
+        try:
+            frame = cv2.imdecode(np.frombuffer(frame_data, np.uint8), cv2.IMREAD_COLOR)
+        except cv2.error:
+            continue # corrupt payload: skip this frame rather than kill the receiver
+        if frame is None:
+            continue
+        try:
+            frames.put_nowait(frame)
+        except queue.Full:
+            try:
+                frames.get_nowait()
+            except queue.Empty:
+                pass
+            frames.put_nowait(frame)
+
+
 client_socket = socket.socket(socket.AF_INET,socket.SOCK_STREAM)
+client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 64<<10) # a few frames: a larger window just buffers stale video
 client_socket.connect((host_ip,port)) # a tuple
+client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
 
+frames = queue.Queue(maxsize=1)
+receiver = threading.Thread(target=receive_frames, args=(client_socket, frames), daemon=True)
+receiver.start()
+
+# OpenCV's GUI has to stay on the main thread (macOS), so only display happens here
 count = 0
-while True:
-    
-    while len(data) < payload_size:
-        packet = client_socket.recv(4*1024) # 4K
-        if not packet: 
+frames_since = 0
+last = time.monotonic()
+while receiver.is_alive() or not frames.empty():
+    try:
+        frame = frames.get(timeout=0.05)
+    except queue.Empty:
+        # Nothing from the network yet: keep pumping the GUI so the window stays responsive
+        if cv2.waitKey(1) & 0xFF == ord('q'):
             break
-        data+=packet
-    packed_msg_size = data[:payload_size]
-    data = data[payload_size:]
-    msg_size = struct.unpack("Q",packed_msg_size)[0]
-    
-    while len(data) < msg_size:
-        data += client_socket.recv(4*1024)
-
-    frame_data = data[:msg_size]
-    data  = data[msg_size:]
-    frame = pickle.loads(frame_data)
-
+        continue
 
-    print('Received Image:', count)
     count += 1
+    frames_since += 1
+    now = time.monotonic()
+    if now - last >= 1.0: # report once a second instead of printing every frame
+        print('Received Images: %d (%.1f fps)' % (count, frames_since / (now - last)))
+        frames_since = 0
+        last = now
     cv2.imshow("RECEIVING VIDEO",frame)
     key = cv2.waitKey(1) & 0xFF
     if key  == ord('q'):
         break
 
+try:
+    client_socket.shutdown(socket.SHUT_RDWR) # wakes the receiver out of recv_into
+except OSError:
+    pass
 client_socket.close()
@@ -1,7 +1,13 @@
-import socket, cv2, pickle,struct
+import os
+os.environ.setdefault("OMP_NUM_THREADS", "1") # must be set before cv2/numpy load their thread pools
+import socket, cv2, struct
+import numpy as np
+import queue
 import threading
 import time
 
+cv2.setNumThreads(1) # one small frame at a time: thread fan-out costs more than it saves
+
  
 
 sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -13,33 +19,130 @@ port = 8002
 socket_address = (host_ip,port)
 command_address = (host_ip,port+1)
 
+# Wire format: [uint64 size][JPEG bytes]
+HEADER = struct.Struct("Q")
+pack_header = HEADER.pack
+HAS_SENDMSG = hasattr(socket.socket, "sendmsg") # Windows has no sendmsg
+ENCODE_PARAMS = [int(cv2.IMWRITE_JPEG_QUALITY), 80]
+
+# Reused by send_frame() where sendmsg is missing; grown if a frame ever outgrows it
+send_buffer = bytearray(2*1024*1024)
+
+
+def send_frame(conn, payload):
+    payload = memoryview(payload).cast("B")
+    if not HAS_SENDMSG:
+        size = HEADER.size + len(payload)
+        if len(send_buffer) < size:
+            send_buffer.extend(bytes(size - len(send_buffer)))
+        HEADER.pack_into(send_buffer, 0, len(payload))
+        send_buffer[HEADER.size:size] = payload
+        conn.sendall(memoryview(send_buffer)[:size])
+        return
+    header = pack_header(len(payload))
+    # Gather header and payload in one syscall instead of concatenating them
+    buffers = [memoryview(header), payload]
+    while buffers:
+        sent = conn.sendmsg(buffers)
+        while buffers and sent >= len(buffers[0]):
+            sent -= len(buffers[0])
+            buffers.pop(0)
+        if buffers:
+            buffers[0] = buffers[0][sent:]
+
+
+def configure_camera(vid, target):
+    vid.set(cv2.CAP_PROP_FRAME_WIDTH, target[0])
+    vid.set(cv2.CAP_PROP_FRAME_HEIGHT, target[1])
+    # Don't let the driver queue up frames behind the one we are about to read
+    vid.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+
+def capture_frames(vid, target, frames, stop):
+    # Producer: keep only the newest frame so the sender never works on a stale one
+    miss = 0
+    while not stop.is_set() and vid.isOpened():
+        ret,frame = vid.read()
+        if not ret:
+            miss += 1
+            if miss > 50:
+                # Camera looks gone; reopen it rather than polling a dead device
+                vid.release()
+                vid.open(0)
+                configure_camera(vid, target)
+                miss = 0
+            time.sleep(0.01)
+            continue
+        miss = 0
+        try:
+            frames.put_nowait(frame)
+        except queue.Full:
+            try:
+                frames.get_nowait()
+            except queue.Empty:
+                pass
+            frames.put_nowait(frame)
+
 
 def send_video():
+    server_socket = socket.socket(socket.AF_INET,socket.SOCK_STREAM)# Socket Create
+    if os.name not in ('nt', 'cygwin'): # on Windows SO_REUSEADDR lets a second server steal the port
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)# Inherited by accepted sockets on Linux
+    server_socket.bind(socket_address)# Socket Bind
+    server_socket.listen(5)# Socket Listen
+    print("LISTENING VIDEO AT:",socket_address)
 # Socket Accept
     while True:
-        server_socket = socket.socket(socket.AF_INET,socket.SOCK_STREAM)# Socket Create
-        server_socket.bind(socket_address)# Socket Bind
-        server_socket.listen(5)# Socket Listen
-        print("LISTENING VIDEO AT:",socket_address)
         client_socket,addr = server_socket.accept()
         print('GOT CONNECTION FROM:',addr)
-        if client_socket:
-            vid = cv2.VideoCapture(0)
-            while(vid.isOpened()):
-                try:
-                    img,frame = vid.read()
-                    if img:
-                        frame = cv2.resize(frame,(frame.shape[1]//2, frame.shape[0]//2))
-                        a = pickle.dumps(frame)
-                        message = struct.pack("Q",len(a))+a
-                        client_socket.sendall(message)
-                    else:
-                        time.sleep(0.1)
-                except Exception as e:
-                    print("ERROR:", e)
-                    server_socket.close()
-                    time.sleep(5)
-                    break
+        client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        # Keep the kernel queue to a few ~25 KB JPEGs so a slow client backs up into the
+        # newest-frame queue (and drops frames) instead of buffering seconds of video
+        client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 128<<10)
+        if hasattr(socket, "TCP_NOTSENT_LOWAT"): # Linux/macOS
+            client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NOTSENT_LOWAT, 16<<10)
+        vid = cv2.VideoCapture(0)
+        # Let the driver deliver half the default size instead of resizing every frame
+        width, height = int(vid.get(cv2.CAP_PROP_FRAME_WIDTH)), int(vid.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        if not width or not height:
+            # Some backends only report a size once a frame has been read
+            ret,frame = vid.read()
+            if ret:
+                height, width = frame.shape[:2]
+        if width < 2 or height < 2:
+            print("ERROR: camera returned no frames")
+            vid.release()
+            client_socket.close()
+            continue
+        target = (width//2, height//2)
+        configure_camera(vid, target)
+        target_shape = (target[1], target[0]) # compared against frame.shape, which is (h, w, c)
+        frames = queue.Queue(maxsize=1)
+        stop = threading.Event()
+        capture = threading.Thread(target=capture_frames, args=(vid, target, frames, stop), daemon=True)
+        capture.start()
+        while capture.is_alive():
+            try:
+                frame = frames.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                # Only cameras that ignored the requested size need a software resize
+                if frame.shape[:2] != target_shape:
+                    frame = cv2.resize(frame, target, interpolation=cv2.INTER_AREA)
+                if not frame.flags['C_CONTIGUOUS']:
+                    frame = np.ascontiguousarray(frame)
+                ok, encoded = cv2.imencode('.jpg', frame, ENCODE_PARAMS)
+                if ok:
+                    send_frame(client_socket, encoded)
+            except Exception as e:
+                print("ERROR:", e)
+                break
+        stop.set()
+        capture.join()
+        vid.release()
+        client_socket.close()
 
 
 # t1 = threading.Thread(target=get_command)